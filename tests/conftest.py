@@ -0,0 +1,16 @@
+import pytest
+
+from util import build_postgresql_db, build_sqlite_db
+
+# Fixtures defined here are shared by every test module,
+# so a session-scoped database is built only once per run.
+
+
+@pytest.fixture(scope="session")
+def create_postgresql_db():
+    build_postgresql_db()
+
+
+@pytest.fixture(scope="session")
+def create_sqlite_db():
+    build_sqlite_db()
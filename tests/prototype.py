@@ -6,28 +6,67 @@ import re
 import sqlite3
 import sys
 
-from copy import deepcopy
+from collections import defaultdict, deque
+from itertools import count
 from gizmos.hiccup import render
-from pprint import pformat
 from rdflib import Graph, BNode, URIRef, Literal
 
 from util import compare_graphs
 
+def json_dumps(content):
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+
+# Use orjson for the nested objects when it is available.
+# The fallback produces the same compact JSON.
+# orjson has a fixed nesting limit, which long RDF lists (four levels per item) can exceed,
+# so those go through the json module like before.
+try:
+    import orjson
+
+    def dumps(content):
+        try:
+            return orjson.dumps(content).decode("utf-8")
+        except orjson.JSONEncodeError:
+            return json_dumps(content)
+
+    def loads(content):
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return json.loads(content)
+except ImportError:
+    dumps = json_dumps
+    loads = json.loads
+
 DEBUG=True
 def log(message):
     if DEBUG:
         print(message, file=sys.stderr)
 
+def read_tsv(path):
+    """Read a TSV file with a header row into a list of dicts.
+    Only the non-empty cells of each row are kept, so that rows stay small and
+    a missing column and an empty column look the same."""
+    with open(path) as fh:
+        rows = csv.reader(fh, delimiter="\t")
+        header = next(rows)
+        return [{k: v for k, v in zip(header, row) if v} for row in rows]
+
 prefixes = {}
-with open("tests/prefix.tsv") as fh:
-    rows = csv.DictReader(fh, delimiter="\t")
-    for row in rows:
-        if row.get("prefix"):
-            prefixes[row["prefix"]] = row["base"]
+for row in read_tsv("tests/prefix.tsv"):
+    if row.get("prefix"):
+        prefixes[row["prefix"]] = row["base"]
+# Map each base back to its (first) prefix, for shortening IRIs with a single lookup:
+bases = {}
+for prefix, base in prefixes.items():
+    bases.setdefault(base, prefix)
+
+IRI_PATTERN = re.compile(r"(http:\S+(#|\/))(.*)")
+CURIE_PATTERN = re.compile(r"([\w\-]+):(.*)")
+NON_WORD_PATTERN = re.compile(r"\W")
 
-with open("tests/thin.tsv") as fh:
-#with open("obi-complete.tsv") as fh:
-    thin = list(csv.DictReader(fh, delimiter="\t"))
+thin = read_tsv("tests/thin.tsv")
+#thin = read_tsv("obi-complete.tsv")
 
 # def dict_factory(cursor, row):
 #     d = {}
@@ -50,11 +89,12 @@ def renderSubjects(subjects):
           ex:p
             {"object": "ex:o"}
     """
-    for subject_id in sorted(list(subjects.keys())):
+    for subject_id in sorted(subjects):
         print(subject_id)
-        for predicate in sorted(list(subjects[subject_id].keys())):
+        predicates = subjects[subject_id]
+        for predicate in sorted(predicates):
             print(" ", predicate)
-            for obj in subjects[subject_id][predicate]:
+            for obj in predicates[predicate]:
                 print("   ", obj)
 
 def row2objectMap(row):
@@ -67,18 +107,43 @@ def row2objectMap(row):
         {"value": "Foo", "language": "en"}
         {"value": "0.123", "datatype": "xsd:float"}
     """
-    if row.get("object"):
-        return {"object": row["object"]}
-    elif row.get("value"):
-        if row.get("datatype"):
-            return {"value": row["value"], "datatype": row["datatype"]}
-        elif row.get("language"):
-            return {"value": row["value"], "language": row["language"]}
-        else:
-            return {"value": row["value"]}
-    else:
+    o = row.get("object")
+    if o:
+        return {"object": o}
+    value = row.get("value")
+    if not value:
         log("Invalid RDF row {}".format(row))
         #raise Exception("Invalid RDF row")
+        return None
+    datatype = row.get("datatype")
+    if datatype:
+        return {"value": value, "datatype": datatype}
+    language = row.get("language")
+    if language:
+        return {"value": value, "language": language}
+    return {"value": value}
+
+
+# The source, property and target predicates of OWL annotations and RDF reifications,
+# with the key that the annotation or metadata is nested under:
+REIFICATIONS = [
+    (
+        ("owl:annotatedSource", "owl:annotatedProperty", "owl:annotatedTarget"),
+        "annotations",
+        "OWL annotation",
+    ),
+    (("rdf:subject", "rdf:predicate", "rdf:object"), "metadata", "RDF reification"),
+]
+
+
+def clone(content):
+    """Copy a nested structure of dicts and lists, sharing the (immutable) leaves.
+    This is much cheaper than deepcopy for the JSON-shaped maps used here."""
+    if isinstance(content, dict):
+        return {k: clone(v) for k, v in content.items()}
+    if isinstance(content, list):
+        return [clone(v) for v in content]
+    return content
 
 
 def thin2subjects(thin):
@@ -88,122 +153,94 @@ def thin2subjects(thin):
     to
         {"ex:s": {"ex:p": [{"object": "ex:o"}]}}
     """
-    dependencies = {}
-    subject_ids = set(x["subject"] for x in thin)
-    subjects = {}
-
-    # Convert rows to a subject dict.
-    for subject_id in subject_ids:
-        predicates = {}
-        for row in thin:
-            if row["subject"] != subject_id:
+    dependencies = defaultdict(set)
+    dependents = defaultdict(set)
+    subjects = defaultdict(lambda: defaultdict(list))
+    object_maps = {}
+
+    # Convert rows to a subject dict in a single pass.
+    for row in thin:
+        subject_id = row["subject"]
+        predicate = row["predicate"]
+        o = row.get("object")
+        if not o:
+            # Literal rows have a few shapes, so leave them to row2objectMap.
+            obj = row2objectMap(row)
+            if not obj:
+                log("Bad object: <{} {} {}>".format(subject_id, predicate, obj))
+                continue
+            subjects[subject_id][predicate].append(obj)
+            continue
+        # Object maps are never modified in place before they are cloned below,
+        # so rows with the same object can share a single map.
+        obj = object_maps.get(o)
+        if obj is None:
+            obj = object_maps[o] = {"object": o}
+        subjects[subject_id][predicate].append(obj)
+        if o[:2] == "_:":
+            dependencies[subject_id].add(o)
+            # Index each blank node to the places that refer to it.
+            dependents[o].add((subject_id, predicate))
+
+    # Back to plain dicts, so that looking up a missing subject or predicate below fails loudly.
+    subjects = {subject_id: dict(predicates) for subject_id, predicates in subjects.items()}
+    # Sort each list of objects once, now that all the rows have been collected.
+    for predicates in subjects.values():
+        for objects in predicates.values():
+            objects.sort(key=str)
+
+    # Work from leaves to root, nesting the blank structures (a topological sort). A blank node is
+    # a leaf once all of its own dependencies have been nested, so each reference is visited once.
+    leaves = deque(b for b in dependents if b in subjects and b not in dependencies)
+    while leaves:
+        leaf = leaves.popleft()
+        nested = subjects.pop(leaf)
+        parents = set()
+        for subject_id, predicate in dependents[leaf]:
+            objects = subjects[subject_id][predicate]
+            for i, obj in enumerate(objects):
+                if obj.get("object") == leaf:
+                    objects[i] = {"object": nested}
+            parents.add(subject_id)
+        for subject_id in parents:
+            remaining = dependencies[subject_id]
+            remaining.discard(leaf)
+            if remaining:
                 continue
-            predicate = row["predicate"]
-            if predicate not in predicates:
-                predicates[predicate] = []
-            objects = predicates[predicate]
-            objects.append(row2objectMap(row))
-            objects.sort(key=lambda k: str(k))
-            predicates[predicate] = objects
-            if row.get("object") and row["object"].startswith("_:"):
-                if not subject_id in dependencies:
-                    dependencies[subject_id] = set()
-                dependencies[subject_id].add(row["object"])
-        subjects[subject_id] = predicates
-
-    # Work from leaves to root, nesting the blank structures.
-    last_leaves = 0
-    while dependencies:
-        leaves = set(subjects.keys()) - set(dependencies.keys())
-        if len(leaves) == last_leaves:
-            # This is not necessarily a problem, so we comment out the `break` statement here, but
-            # we emit a warning anyway.
-            log("LOOP!?")
-            # break
-        last_leaves = len(leaves)
-        dependencies = {}
-        handled = set()
-        for subject_id, predicates in subjects.items():
-            for predicate in predicates.keys():
-                objects = []
-                for obj in predicates[predicate]:
-                    if not obj:
-                        log("Bad object: <{} {} {}>".format(subject_id, predicate, obj))
-                        continue
-                    o = obj.get("object")
-                    if o and isinstance(o, str) and o.startswith("_:"):
-                        if o in leaves:
-                            obj = {"object": subjects[o]}
-                            handled.add(o)
-                        else:
-                            if not subject_id in dependencies:
-                                dependencies[subject_id] = set()
-                            dependencies[subject_id].add(o)
-                    objects.append(obj)
-                objects.sort(key=lambda k: str(k))
-                predicates[predicate] = objects
-        for subject_id in handled:
-            del subjects[subject_id]
+            del dependencies[subject_id]
+            # Everything is nested now, so the objects can be put in their final order.
+            for objects in subjects[subject_id].values():
+                objects.sort(key=str)
+            if subject_id in dependents:
+                leaves.append(subject_id)
+    if dependencies:
+        # Cycles or dangling blank nodes: this is not necessarily a problem, but emit a warning.
+        log("LOOP!? Unresolved blank nodes: {}".format(dependencies))
 
     remove = set()
     subjects_copy = {}
-    for subject_id in sorted(subjects.keys()):
+    for subject_id in sorted(subjects):
         if not subjects_copy.get(subject_id):
-            subjects_copy[subject_id] = deepcopy(subjects[subject_id])
-
-        if subjects_copy[subject_id].get("owl:annotatedSource"):
-            log("OWL annotation: {}".format(subject_id))
-            subject = firstObject(subjects_copy[subject_id], "owl:annotatedSource")
-            predicate = firstObject(subjects_copy[subject_id], "owl:annotatedProperty")
-            obj = firstObject(subjects_copy[subject_id], "owl:annotatedTarget")
-            log("<{}, {}, {}>".format(subject, predicate, obj))
+            subjects_copy[subject_id] = clone(subjects[subject_id])
+        current = subjects_copy[subject_id]
 
-            del subjects_copy[subject_id]["owl:annotatedSource"]
-            del subjects_copy[subject_id]["owl:annotatedProperty"]
-            del subjects_copy[subject_id]["owl:annotatedTarget"]
-            del subjects_copy[subject_id]["rdf:type"]
-
-            if not subjects_copy.get(subject):
-                subjects_copy[subject] = deepcopy(subjects[subject])
-            if not subjects_copy[subject].get(predicate):
-                subjects_copy[subject][predicate] = deepcopy(subjects[subject][predicate])
-
-            objs = subjects_copy[subject][predicate]
-            objs_copy = []
-            for o in objs:
-                o = deepcopy(o)
-                if o.get("object") == obj:
-                    o["annotations"] = subjects_copy[subject_id]
-                    remove.add(subject_id)
-                objs_copy.append(o)
-            subjects_copy[subject][predicate] = objs_copy
-
-        if subjects_copy[subject_id].get("rdf:subject"):
-            log("RDF reification: {}".format(subject_id))
-            subject = firstObject(subjects_copy[subject_id], "rdf:subject")
-            predicate = firstObject(subjects_copy[subject_id], "rdf:predicate")
-            obj = firstObject(subjects_copy[subject_id], "rdf:object")
+        for keys, kind, description in REIFICATIONS:
+            if not current.get(keys[0]):
+                continue
+            log("{}: {}".format(description, subject_id))
+            subject, predicate, obj = (firstObjectOf(current.pop(key, None)) for key in keys)
             log("<{}, {}, {}>".format(subject, predicate, obj))
-
-            del subjects_copy[subject_id]["rdf:subject"]
-            del subjects_copy[subject_id]["rdf:predicate"]
-            del subjects_copy[subject_id]["rdf:object"]
-            del subjects_copy[subject_id]["rdf:type"]
+            del current["rdf:type"]
 
             if not subjects_copy.get(subject):
-                subjects_copy[subject] = deepcopy(subjects[subject])
-            if not subjects_copy[subject].get(predicate):
-                subjects_copy[subject][predicate] = deepcopy(subjects[subject][predicate])
-
-            objs = subjects_copy[subject][predicate]
-            objs_copy = []
-            for o in objs:
-                o = deepcopy(o)
+                subjects_copy[subject] = clone(subjects[subject])
+            target = subjects_copy[subject]
+            objs_copy = clone(target.get(predicate) or subjects[subject][predicate])
+            for o in objs_copy:
                 if o.get("object") == obj:
-                    o["metadata"] = subjects_copy[subject_id]
+                    o[kind] = current
                     remove.add(subject_id)
-                objs_copy.append(o)
-            subjects_copy[subject][predicate] = objs_copy
+            target[predicate] = objs_copy
 
     for t in remove:
         del subjects_copy[t]
@@ -211,26 +248,31 @@ def thin2subjects(thin):
     return subjects_copy
 
 
-def subjects2thick(subjects):
-    """Convert a nested subjects map to thick rows.
-    From
-        {"ex:s": {"ex:p": [{"object": {"ex:a": [{"value": "A"}]}}]}}
-    to
-        {"subject": "ex:s", "predicate": "ex:p", "object": "{\"ex:a\":[{\"value\": \"A\"}]}"}
-    """
-    rows = []
-    for subject_id in sorted(list(subjects.keys())):
-        for predicate in sorted(list(subjects[subject_id].keys())):
-            for obj in subjects[subject_id][predicate]:
+def iter_thick(subjects):
+    """Yield the thick rows for a nested subjects map one at a time,
+    sorted by subject and predicate."""
+    for subject_id in sorted(subjects):
+        predicates = subjects[subject_id]
+        for predicate in sorted(predicates):
+            for obj in predicates[predicate]:
                 result = {
                     "subject": subject_id,
                     "predicate": predicate,
                     **obj
                 }
                 if result.get("object") and not isinstance(result["object"], str):
-                    result["object"] = json.dumps(result["object"])
-                rows.append(result)
-    return rows
+                    result["object"] = dumps(result["object"])
+                yield result
+
+
+def subjects2thick(subjects):
+    """Convert a nested subjects map to a list of thick rows.
+    From
+        {"ex:s": {"ex:p": [{"object": {"ex:a": [{"value": "A"}]}}]}}
+    to
+        {"subject": "ex:s", "predicate": "ex:p", "object": "{\"ex:a\":[{\"value\":\"A\"}]}"}
+    """
+    return list(iter_thick(subjects))
 
 
 def thick2subjects(thick):
@@ -243,27 +285,28 @@ def render_graph(graph):
     ttls = sorted([(s, p, o) for s, p, o in graph])
     def shorten(content):
         if isinstance(content, URIRef):
-            m = re.compile(r"(http:\S+(#|\/))(.*)").match(content)
-            if m:
-                for key in prefixes:
-                    if m[1] == prefixes[key]:
-                        return "{}:{}".format(key, m[3])
+            m = IRI_PATTERN.match(content)
+            if m and m[1] in bases:
+                return "{}:{}".format(bases[m[1]], m[3])
         if content.startswith("http"):
             content = "<{}>".format(content)
         return content
 
+    # Build each line from its parts and print them all at once:
+    lines = []
     for subj, pred, obj in ttls:
-        print("{} {} ".format(shorten(subj), shorten(pred)), end="")
         if isinstance(obj, Literal) and obj.datatype:
-            print('"{}"^^{} '.format(obj.value, shorten(obj.datatype)), end="")
+            obj = '"' + str(obj.value) + '"^^' + shorten(obj.datatype)
         elif isinstance(obj, Literal) and obj.language:
-            print('"{}"@{} '.format(obj.value, obj.language), end="")
+            obj = '"' + str(obj.value) + '"@' + obj.language
         else:
-            print("{} ".format(shorten(obj)), end="")
-        print(".")
+            obj = shorten(obj)
+        lines.append("".join((shorten(subj), " ", shorten(pred), " ", obj, " .")))
+    if lines:
+        print("\n".join(lines))
 
 def deprefix(content):
-    m = re.compile(r"([\w\-]+):(.*)").match(content)
+    m = CURIE_PATTERN.match(content)
     if m and prefixes.get(m[1]):
         return "{}{}".format(prefixes[m[1]], m[2])
 
@@ -289,98 +332,109 @@ def create_node(content):
 
 def triples2graph(triples):
     graph = Graph()
-    for triple in triples:
-        subj = create_node(triple['subject'])
-        pred = create_node(triple['predicate'])
-        obj = triple['object']
-        if isinstance(obj, str) or isinstance(obj, dict):
-            graph.add((subj, pred, create_node(obj)))
-        else:
-            # Look through triple['object'], and if the block is either a reification
-            # or an annotation, switch the subject with the object being annotated/reified, otherwise
-            # leave the subject as is:
-            nested_target = None
-            for item in obj:
-                if item['predicate'] in ['owl:annotatedTarget', 'rdf:object']:
-                    nested_target = item['object']
-                    break
-                elif not nested_target:
-                    nested_target = item['subject']
-            graph.add((subj, pred, create_node(nested_target)))
-            [graph.add((s, p, o)) for s, p, o in triples2graph(obj)]
-
+    # Collect all the triples first and add them to the graph in a single batch:
+    nodes = []
+    # Nested triple lists are pushed onto a stack rather than handled recursively:
+    stack = [triples]
+    while stack:
+        for triple in stack.pop():
+            subj = create_node(triple['subject'])
+            pred = create_node(triple['predicate'])
+            obj = triple['object']
+            if isinstance(obj, str) or isinstance(obj, dict):
+                nodes.append((subj, pred, create_node(obj)))
+            else:
+                # Look through triple['object'], and if the block is either a reification
+                # or an annotation, switch the subject with the object being annotated/reified, otherwise
+                # leave the subject as is:
+                nested_target = None
+                for item in obj:
+                    if item['predicate'] in ['owl:annotatedTarget', 'rdf:object']:
+                        nested_target = item['object']
+                        break
+                    elif not nested_target:
+                        nested_target = item['subject']
+                nodes.append((subj, pred, create_node(nested_target)))
+                stack.append(obj)
+
+    graph.addN((s, p, o, graph) for s, p, o in nodes)
     return graph
 
+def decompress_annotation(thick_row, target, kind):
+    if isinstance(target, str):
+        target = {'owl:annotatedTarget': [{kind: target}]}
+    target['owl:annotatedSource'] = [{'object': thick_row['subject']}]
+    target['owl:annotatedProperty'] = [{'object': thick_row['predicate']}]
+    target['rdf:type'] = [{'object': 'owl:Axiom'}]
+    for key in thick_row['annotations']:
+        target[key] = thick_row['annotations'][key]
+    return target
+
+def decompress_reification(thick_row, target, kind):
+    if isinstance(target, str):
+        target = {'rdf:object': [{kind: target}]}
+    target['rdf:subject'] = [{'object': thick_row['subject']}]
+    target['rdf:predicate'] = [{'object': thick_row['predicate']}]
+    target['rdf:type'] = [{'object': 'rdf:Statement'}]
+    for key in thick_row['metadata']:
+        target[key] = thick_row['metadata'][key]
+    return target
+
 def thick2obj(thick_row):
-    log("In thick2obj. Received thick_row: {}".format(thick_row))
+    if DEBUG:
+        log("In thick2obj. Received thick_row: {}".format(thick_row))
 
-    if 'object' not in thick_row and 'value' not in thick_row:
+    if 'object' in thick_row:
+        kind = 'object'
+    elif 'value' in thick_row:
+        kind = 'value'
+    else:
         raise Exception(f"Don't know how to handle thick_row without value or object: {thick_row}")
 
-    def decompress_annotation(target, kind):
-        if isinstance(target, str):
-            target = {'owl:annotatedTarget': [{kind: target}]}
-        target['owl:annotatedSource'] = [{'object': thick_row['subject']}]
-        target['owl:annotatedProperty'] = [{'object': thick_row['predicate']}]
-        target['rdf:type'] = [{'object': 'owl:Axiom'}]
-        for key in thick_row['annotations']:
-            target[key] = thick_row['annotations'][key]
-        return target
-
-    def decompress_reification(target, kind):
-        if isinstance(target, str):
-            target = {'rdf:object': [{kind: target}]}
-        target['rdf:subject'] = [{'object': thick_row['subject']}]
-        target['rdf:predicate'] = [{'object': thick_row['predicate']}]
-        target['rdf:type'] = [{'object': 'rdf:Statement'}]
-        for key in thick_row['annotations']:
-            target[key] = thick_row['metadata'][key]
-        return target
-
-    def obj2obj(thick_row):
-        target = thick_row['object']
-        triples = []
-        if 'annotations' not in thick_row and 'metadata' not in thick_row:
-            if not isinstance(target, str):
-                triples = predicateMap2triples(target)
-        else:
-            if 'annotations' in thick_row:
-                triples += predicateMap2triples(decompress_annotation(target, 'object'))
-            if 'metadata' in thick_row:
-                triples += predicateMap2triples(decompress_reification(target, 'object'))
-        return target if not triples else triples
-
-    def val2obj(thick_row):
-        target = thick_row['value']
-        value_obj = {}
-        triples = []
+    target = thick_row[kind]
+    has_annotations = 'annotations' in thick_row
+    has_metadata = 'metadata' in thick_row
+    triples = []
+    if not has_annotations and not has_metadata:
+        if not isinstance(target, str):
+            triples = predicateMap2triples(target)
+    else:
+        if has_annotations:
+            triples += predicateMap2triples(decompress_annotation(thick_row, target, kind))
+        if has_metadata:
+            triples += predicateMap2triples(decompress_reification(thick_row, target, kind))
+    if triples:
+        return triples
+
+    if kind == 'value':
         if 'datatype' in thick_row:
-            value_obj = {'value': target, 'datatype': thick_row['datatype']}
+            return {'value': target, 'datatype': thick_row['datatype']}
         elif 'language' in thick_row:
-            value_obj = {'value': target, 'language': thick_row['language']}
+            return {'value': target, 'language': thick_row['language']}
+    return target
 
-        if 'annotations' not in thick_row and 'metadata' not in thick_row:
-            if not isinstance(target, str):
-                triples = predicateMap2triples(target)
-        else:
-            if 'annotations' in thick_row:
-                triples += predicateMap2triples(decompress_annotation(target, 'value'))
-            if 'metadata' in thick_row:
-                triples += predicateMap2triples(decompress_reification(target, 'value'))
-        return triples or value_obj or target
-
-    if "object" in thick_row:
-        return obj2obj(thick_row)
-    elif 'value' in thick_row:
-        return val2obj(thick_row)
+bnode_ids = count(1)
+def next_bnode():
+    return f"_:myb{next(bnode_ids)}"
+
+def renumber(triples, bnodes):
+    """Copy a list of generated triples, giving each generated blank node a fresh ID."""
+    result = []
+    for triple in triples:
+        subject = triple['subject']
+        if subject not in bnodes:
+            bnodes[subject] = next_bnode()
+        obj = triple['object']
+        if isinstance(obj, list):
+            obj = renumber(obj, bnodes)
+        result.append({'subject': bnodes[subject], 'predicate': triple['predicate'], 'object': obj})
+    return result
 
-b = 0
 def predicateMap2triples(pred_map):
-    global b
-    b += 1
-    log("In predicateMap2triples. Received: {}".format(pred_map))
+    if DEBUG:
+        log("In predicateMap2triples. Received: {}".format(pred_map))
 
-    bnode = f"_:myb{b}"
+    bnode = next_bnode()
     triples = []
     for predicate, objects in pred_map.items():
         for obj in objects:
@@ -389,15 +443,27 @@ def predicateMap2triples(pred_map):
     return triples
 
 def thick2triples(thick_rows):
-    log("In thick2triples. Received thick_rows: {}".format(thick_rows))
+    if DEBUG:
+        log("In thick2triples. Received thick_rows: {}".format(thick_rows))
     triples = []
+    # Class expressions are often repeated, so reuse the triples generated for
+    # the same object JSON within this call, but with new blank nodes:
+    generated = {}
     for row in thick_rows:
+        key = None
         if "object" in row:
             o = row["object"]
-            if isinstance(o, str) and o.startswith("{"):
-                row["object"] = json.loads(o)
+            if isinstance(o, str) and o[:1] == "{":
+                if "annotations" not in row and "metadata" not in row:
+                    key = o
+                row["object"] = loads(o)
 
-        obj = thick2obj(row)
+        if key in generated:
+            obj = renumber(generated[key], {})
+        else:
+            obj = thick2obj(row)
+            if key and isinstance(obj, list):
+                generated[key] = obj
         triples.append({'subject': row['subject'], 'predicate': row['predicate'], 'object': obj})
     return triples
 
@@ -405,10 +471,13 @@ owlTypes = ["owl:Restriction"]
 
 def firstObject(predicates, predicate):
     """Given a prediate map, return the first 'object'."""
-    if predicates.get(predicate):
-        for obj in predicates[predicate]:
-            if obj.get("object"):
-                return obj["object"]
+    return firstObjectOf(predicates.get(predicate))
+
+
+def firstObjectOf(objects):
+    """Given a list of objects (or None), return the first 'object'."""
+    if objects:
+        return next((obj["object"] for obj in objects if obj.get("object")), None)
 
 
 def rdf2list(predicates):
@@ -425,20 +494,36 @@ def rdf2list(predicates):
         [{"value": "A"}, {"value": "B"}]
     """
     result = []
-    if "rdf:first" in predicates:
-        result.append(predicates["rdf:first"][0])
-    if "rdf:rest" in predicates:
+    # Follow the rdf:rest links in a loop, rather than recursing for each item.
+    while isinstance(predicates, dict):
+        if "rdf:first" in predicates:
+            result.append(predicates["rdf:first"][0])
+        if "rdf:rest" not in predicates:
+            break
         o = predicates["rdf:rest"][0]
-        if not o:
-            return result
-        if not o.get("object"):
-            return result
-        if o["object"] == "rdf:nil":
-            return result
-        return result + rdf2list(o["object"])
+        if not o or not o.get("object") or o["object"] == "rdf:nil":
+            break
+        predicates = o["object"]
     return result
 
 
+def _ofs_restriction(predicates):
+    onProperty = firstObject(predicates, "owl:onProperty")
+    someValuesFrom = firstObject(predicates, "owl:someValuesFrom")
+    return ["ObjectSomeValuesFrom", onProperty, someValuesFrom]
+
+
+def _ofs_list(predicates):
+    return ["RDFList"] + rdf2list(predicates)
+
+
+# TODO: handle all the OFN types (See: https://www.w3.org/TR/2012/REC-owl2-mapping-to-rdf-20121211/)
+_OFS_HANDLERS = {
+    "owl:Restriction": _ofs_restriction,
+    "rdf:List": _ofs_list,
+}
+
+
 def rdf2ofs(predicates):
     """Given a predicate map, try to return an OWL Functional S-Expression.
     From
@@ -449,17 +534,10 @@ def rdf2ofs(predicates):
         ["ObjectSomeValuesFrom", "ex:part-of", "ex:bar"]
     """
     rdfType = firstObject(predicates, "rdf:type")
-    result = None
-    if rdfType == "owl:Restriction":
-        onProperty = firstObject(predicates, "owl:onProperty")
-        someValuesFrom = firstObject(predicates, "owl:someValuesFrom")
-        result = ["ObjectSomeValuesFrom", onProperty, someValuesFrom]
-    elif rdfType == "rdf:List":
-        result = ["RDFList"] + rdf2list(predicates)
-    # TODO: handle all the OFN types (See: https://www.w3.org/TR/2012/REC-owl2-mapping-to-rdf-20121211/)
-    else:
+    handler = _OFS_HANDLERS.get(rdfType)
+    if not handler:
         raise Exception(f"Unhandled type '{rdfType}' for: {predicates}")
-    return result
+    return handler(predicates)
 
 
 def thick2reasoned(thick):
@@ -471,34 +549,47 @@ def thick2reasoned(thick):
          {"super": "ex:b", "sub": "ex:a"}]
     """
     reasoned = []
+    # Class expressions are often shared, so parse each distinct JSON string once per call
+    parsed = {}
     for row in thick:
-        owl = None
-        if row["predicate"] in ["rdfs:subClassOf", "owl:equivalentClass"]:
-            if row.get("object") and isinstance(row["object"], str):
-                if row["object"].startswith("{"):
-                    o = rdf2ofs(json.loads(row["object"]))
-                else:
-                    o = row["object"]
-            result = {
-                "super": o,
-                "sub": row["subject"],
-            }
-            reasoned.append(result)
-        if row["predicate"] in ["owl:equivalentClass"]:
-            result = {
-                "super": row["subject"],
-                "sub": o,
-            }
-            reasoned.append(result)
+        predicate = row["predicate"]
+        if predicate not in ("rdfs:subClassOf", "owl:equivalentClass"):
+            continue
+        obj = row.get("object")
+        if not obj or not isinstance(obj, str):
+            continue
+        if obj[:1] == "{":
+            if obj not in parsed:
+                parsed[obj] = rdf2ofs(loads(obj))
+            # Each row gets its own copy, so callers can change it safely
+            o = list(parsed[obj])
+        else:
+            o = obj
+        reasoned.append({"super": o, "sub": row["subject"]})
+        if predicate == "owl:equivalentClass":
+            reasoned.append({"super": row["subject"], "sub": o})
     return reasoned
 
 
 def quote(label):
-    if re.search(r'\W', label):
+    if NON_WORD_PATTERN.search(label):
         return f"'{label}'"
     return label
 
 
+def _omn_some(labels, ofs):
+    get_label = labels.get
+    onProperty = quote(get_label(ofs[1], ofs[1]))
+    someValuesFrom = quote(get_label(ofs[2], ofs[2]))
+    return f"{onProperty} some {someValuesFrom}"
+
+
+# TODO: handle all the OFN types
+_OMN_HANDLERS = {
+    "ObjectSomeValuesFrom": _omn_some,
+}
+
+
 def ofs2omn(labels, ofs):
     """Convert OFS to Manchester (OMN) with labels.
     From
@@ -506,14 +597,10 @@ def ofs2omn(labels, ofs):
     to
         'part of' some Bar
     """
-    first = ofs[0]
-    if first == "ObjectSomeValuesFrom":
-        onProperty = quote(labels.get(ofs[1], ofs[1]))
-        someValuesFrom = quote(labels.get(ofs[2], ofs[2]))
-        return f"{onProperty} some {someValuesFrom}"
-    # TODO: handle all the OFN types
-    else:
-        raise Exception(f"Unhandled expression type '{first}' for: {ofs}")
+    handler = _OMN_HANDLERS.get(ofs[0])
+    if not handler:
+        raise Exception(f"Unhandled expression type '{ofs[0]}' for: {ofs}")
+    return handler(labels, ofs)
 
 
 def po2rdfa(labels, predicate, obj):
@@ -532,10 +619,11 @@ def po2rdfa(labels, predicate, obj):
               },
               labels.get(o, o),
             ]
-        try:
-            return ofs2rdfa(labels, rdf2ofs(o))
-        except:
-            return ["span", str(o)]
+        if firstObject(o, "rdf:type") in _OFS_HANDLERS:
+            html = ofs2rdfa(labels, rdf2ofs(o))
+            if html:
+                return html
+        return ["span", str(o)]
     elif obj.get("value"):
         return [
           "span",
@@ -546,33 +634,48 @@ def po2rdfa(labels, predicate, obj):
         raise Exception(f"Unhandled object: {obj}")
 
 
+def _rdfa_some(labels, ofs):
+    # Only named properties and classes are rendered for now,
+    # otherwise (e.g. owl:allValuesFrom or a nested restriction) return None to fall back
+    if not isinstance(ofs[1], str) or not isinstance(ofs[2], str):
+        return None
+    onProperty = po2rdfa(labels, "owl:onProperty", ofs[1])
+    someValuesFrom = po2rdfa(labels, "owl:someValuesFrom", ofs[2])
+    return ["span", onProperty, " some ", someValuesFrom]
+
+
+def _rdfa_list(labels, ofs):
+    return ["span", "TODO " + str(ofs)]
+
+
+# TODO: handle all the OFN types
+_RDFA_HANDLERS = {
+    "ObjectSomeValuesFrom": _rdfa_some,
+    "RDFList": _rdfa_list,
+}
+
+
 def ofs2rdfa(labels, ofs):
-    """Convert an OFS list to an HTML vector."""
-    first = ofs[0]
-    if first == "ObjectSomeValuesFrom":
-        onProperty = po2rdfa(labels, "owl:onProperty", ofs[1])
-        someValuesFrom = po2rdfa(labels, "owl:someValuesFrom", ofs[2])
-        return ["span", onProperty, " some ", someValuesFrom]
-    elif first == "RDFList":
-        return ["span", "TODO " + str(ofs)]
-    # TODO: handle all the OFN types
-    else:
-        raise Exception(f"Unhandled expression type '{first}' for: {ofs}")
+    """Convert an OFS list to an HTML vector, or None if it cannot be rendered yet."""
+    handler = _RDFA_HANDLERS.get(ofs[0])
+    if not handler:
+        raise Exception(f"Unhandled expression type '{ofs[0]}' for: {ofs}")
+    return handler(labels, ofs)
 
 
 def rows2labels(rows):
     """Given a list of rows, return a map from subject to rdfs:label value."""
-    labels = {}
-    for row in rows:
-        if row["predicate"] == "rdfs:label":
-            labels[row["subject"]] = row["value"]
-    return labels
+    return {
+        row["subject"]: row["value"]
+        for row in rows
+        if row["predicate"] == "rdfs:label" and "value" in row
+    }
 
 
 def subject2rdfa(labels, subject_id, predicates):
     """Convert a subject_id and predicate map to an HTML vector."""
     html = ["ul"]
-    for predicate in sorted(list(predicates.keys())):
+    for predicate in sorted(predicates):
         for obj in predicates[predicate]:
             html.append(["li", po2rdfa(labels, predicate, obj)])
     return ["li", subject_id, html]
@@ -581,7 +684,7 @@ def subject2rdfa(labels, subject_id, predicates):
 def subjects2rdfa(labels, subjects):
     """Convert a subject_id and subjects map to an HTML vector."""
     html = ["ul"]
-    for subject_id in sorted(list(subjects.keys())):
+    for subject_id in sorted(subjects):
         html.append(subject2rdfa(labels, subject_id, subjects[subject_id]))
     return html
 
@@ -590,12 +693,14 @@ if __name__ == "__main__":
     rdfList = {'rdf:type': [{'object': 'rdf:List'}], 'rdf:first': [{'value': 'A'}], 'rdf:rest': [{'object': {'rdf:type': [{'object': 'rdf:List'}], 'rdf:first': [{'value': 'B'}], 'rdf:rest': [{'object': 'rdf:nil'}]}}]}
     log("List {}".format(rdf2ofs(rdfList)))
 
-    log("THIN ROWS:")
-    [log(row) for row in thin]
+    if DEBUG:
+        log("THIN ROWS:")
+        for row in thin:
+            log(row)
 
     subjects = thin2subjects(thin)
     #print("SUBJECTS:")
-    #print(pformat(subjects))
+    #print(json.dumps(subjects, indent=2))
     #renderSubjects(subjects)
     #print("#############################################")
 
@@ -605,12 +710,12 @@ if __name__ == "__main__":
     #print("#############################################")
 
     #print("PREFIXES:")
-    #print(pformat(prefixes))
+    #print(json.dumps(prefixes, indent=2))
     #print("#############################################")
 
     triples = thick2triples(thick)
     #print("INTERIM TRIPLES:")
-    #print(pformat(triples))
+    #print(json.dumps(triples, indent=2))
     #print("#############################################")
 
     actual = triples2graph(triples)
@@ -1,123 +1,93 @@
 import sys
 
-from copy import deepcopy
 import translationUtil as tUtil
 
 DEBUG = True
 
 
-def log(message):
-    if DEBUG:
-        print(message, file=sys.stderr)
-
-
-def handleAllDisjointClasses(subjects):
-    remove = set()
-    subjects_copy = {}
-    for subject in sorted(subjects.keys()):
-
-        if not subjects_copy.get(subject):
-            subjects_copy[subject] = deepcopy(subjects[subject])
-
-        if(subject.startswith("_")):
-            if(subjects_copy[subject].get("rdf:type")):
-                if(tUtil.firstObject(subjects_copy[subject], "rdf:type") == "owl:AllDisjointClasses"):
-                    members = tUtil.firstObject(subjects_copy[subject],"owl:members")
-
-                    del subjects_copy[subject]["rdf:type"]
-                    del subjects_copy[subject]["owl:members"]
-                    #del subjects_copy[subject]
-                    memberMap = {}
-                    memberMap["owl:members"] = members
-                    object = {}
-                    object["object"] = memberMap
-                    objectList = []
-                    objectList.append(object)
-                    allDisjointMap = {}
-                    allDisjointMap["owl:AllDisjointClasses"] = objectList
-                    subjects_copy[subject] = allDisjointMap 
-
-    return subjects_copy
-
-def handleAnnotations(subjects):
-    remove = set()
-    subjects_copy = {}
-    for subject_id in sorted(subjects.keys()):
-
-        if not subjects_copy.get(subject_id):
-            subjects_copy[subject_id] = deepcopy(subjects[subject_id]) 
-
-        if subjects_copy[subject_id].get("owl:annotatedSource"):
-            log("OWL annotation: {}".format(subject_id))
-            subject = tUtil.firstObject(subjects_copy[subject_id], "owl:annotatedSource")
-            predicate = tUtil.firstObject(subjects_copy[subject_id], "owl:annotatedProperty")
-            obj = tUtil.firstObject(subjects_copy[subject_id], "owl:annotatedTarget")
-            log("<{}, {}, {}>".format(subject, predicate, obj))
-
-            print("look")
-            print(subjects_copy[subject_id]["owl:annotatedSource"])
-
-            del subjects_copy[subject_id]["owl:annotatedSource"]
-            del subjects_copy[subject_id]["owl:annotatedProperty"]
-            del subjects_copy[subject_id]["owl:annotatedTarget"]
-            del subjects_copy[subject_id]["rdf:type"]
-
-            if not subjects_copy.get(subject):
-                subjects_copy[subject] = deepcopy(subjects[subject])
-            if not subjects_copy[subject].get(predicate):
-                subjects_copy[subject][predicate] = deepcopy(subjects[subject][predicate])
-
-            objs = subjects_copy[subject][predicate]
-            objs_copy = []
-            for o in objs:
-                o = deepcopy(o)
-                if o.get("object") == obj:
-                    o["annotations"] = subjects_copy[subject_id]
-                    remove.add(subject_id)
-                objs_copy.append(o)
-            subjects_copy[subject][predicate] = objs_copy
-
-    for t in remove:
-        print("REMOVE")
-        print(subjects_copy[t])
-        del subjects_copy[t]
-
-    return subjects_copy 
-
-def handleReification(subjects):
+if DEBUG:
+    def log(message, *args):
+        print(message.format(*args) if args else message, file=sys.stderr)
+else:
+    def log(message, *args):
+        pass
+
+
+def writable(subjects_copy, copied, subject):
+    """Return the predicate map of a subject in subjects_copy, making a shallow copy first
+    so that it can be modified without touching the input."""
+    if subject not in copied:
+        subjects_copy[subject] = dict(subjects_copy[subject])
+        copied.add(subject)
+    return subjects_copy[subject]
+
+
+def allDisjointClasses(predicates):
+    members = tUtil.firstObject(predicates,"owl:members")
+
+    memberMap = {}
+    memberMap["owl:members"] = members
+    object = {}
+    object["object"] = memberMap
+    objectList = []
+    objectList.append(object)
+    allDisjointMap = {}
+    allDisjointMap["owl:AllDisjointClasses"] = objectList
+    return allDisjointMap
+
+
+def attach(subjects, subjects_copy, copied, subject_id, keys, kind):
+    """Move an OWL annotation or RDF reification node onto the object it describes,
+    where keys are its source, property and target predicates
+    and kind is the key it is attached under. Return True if the object was found."""
+    node = writable(subjects_copy, copied, subject_id)
+    #read each key's first object as we remove it
+    subject, predicate, obj = (tUtil.firstObjectOf(node.pop(key)) for key in keys)
+    log("<{}, {}, {}>", subject, predicate, obj)
+    del node["rdf:type"]
+
+    target = writable(subjects_copy, copied, subject)
+    objs = target.get(predicate) or subjects[subject][predicate]
+    found = False
+    for i, o in enumerate(objs):
+        if o.get("object") == obj:
+            if not found:
+                #copy the list once, then replace only the annotated objects
+                objs = target[predicate] = list(objs)
+                found = True
+            o = dict(o)
+            o[kind] = node
+            objs[i] = o
+    return found
+
+
+def applySpecialCases(subjects):
+    """Handle owl:AllDisjointClasses, OWL annotations and RDF reifications
+    in a single pass over the subjects."""
     remove = set()
-    subjects_copy = {}
-    for subject_id in sorted(subjects.keys()):
-
-        if not subjects_copy.get(subject_id):
-            subjects_copy[subject_id] = deepcopy(subjects[subject_id]) 
-
-        if subjects_copy[subject_id].get("rdf:subject"):
-            log("RDF reification: {}".format(subject_id))
-            subject = tUtil.firstObject(subjects_copy[subject_id], "rdf:subject")
-            predicate = tUtil.firstObject(subjects_copy[subject_id], "rdf:predicate")
-            obj = tUtil.firstObject(subjects_copy[subject_id], "rdf:object")
-            log("<{}, {}, {}>".format(subject, predicate, obj))
-
-            del subjects_copy[subject_id]["rdf:subject"]
-            del subjects_copy[subject_id]["rdf:predicate"]
-            del subjects_copy[subject_id]["rdf:object"]
-            del subjects_copy[subject_id]["rdf:type"]
-
-            if not subjects_copy.get(subject):
-                subjects_copy[subject] = deepcopy(subjects[subject])
-            if not subjects_copy[subject].get(predicate):
-                subjects_copy[subject][predicate] = deepcopy(subjects[subject][predicate])
-
-            objs = subjects_copy[subject][predicate]
-            objs_copy = []
-            for o in objs:
-                o = deepcopy(o)
-                if o.get("object") == obj:
-                    o["metadata"] = subjects_copy[subject_id]
-                    remove.add(subject_id)
-                objs_copy.append(o)
-            subjects_copy[subject][predicate] = objs_copy
+    subjects_copy = dict(subjects) #subjects are only copied when they are modified
+    copied = set()
+    #visit subjects in sorted order: when several nodes annotate the same triple,
+    #the last one attached wins, and that must not depend on the row order
+    for subject_id in sorted(subjects):
+        predicates = subjects_copy[subject_id]
+
+        if(subject_id.startswith("_")
+                and tUtil.firstObject(predicates, "rdf:type") == "owl:AllDisjointClasses"):
+            subjects_copy[subject_id] = allDisjointClasses(predicates)
+            copied.add(subject_id)
+
+        elif predicates.get("owl:annotatedSource"):
+            log("OWL annotation: {}", subject_id)
+            keys = ("owl:annotatedSource", "owl:annotatedProperty", "owl:annotatedTarget")
+            if attach(subjects, subjects_copy, copied, subject_id, keys, "annotations"):
+                remove.add(subject_id)
+
+        elif predicates.get("rdf:subject"):
+            log("RDF reification: {}", subject_id)
+            keys = ("rdf:subject", "rdf:predicate", "rdf:object")
+            if attach(subjects, subjects_copy, copied, subject_id, keys, "metadata"):
+                remove.add(subject_id)
 
     for t in remove:
         del subjects_copy[t]
@@ -1,8 +1,9 @@
 import csv
 import json
 import sys
-from copy import deepcopy
+from collections import defaultdict, deque
 from pprint import pformat
+from sys import intern
 
 import thin2subjectSpecialCases as specialCase
 import translationUtil as tUtil
@@ -13,9 +14,12 @@ with open("axioms.tsv") as fh:
     thin = list(csv.DictReader(fh, delimiter="\t"))
 
 DEBUG=True
-def log(message):
-    if DEBUG:
-        print(message, file=sys.stderr) 
+if DEBUG:
+    def log(message, *args):
+        print(message.format(*args) if args else message, file=sys.stderr)
+else:
+    def log(message, *args):
+        pass
 
 
 def row2objectMap(row):
@@ -29,7 +33,7 @@ def row2objectMap(row):
         {"value": "0.123", "datatype": "xsd:float"}
     """
     if row.get("object"):
-        return {"object": row["object"]}
+        return {"object": intern(row["object"])}
     elif row.get("value"):
         if row.get("datatype"):
             return {"value": row["value"], "datatype": row["datatype"]}
@@ -38,96 +42,92 @@ def row2objectMap(row):
         else:
             return {"value": row["value"]}
     else:
-        log("Invalid RDF row {}".format(row))
+        log("Invalid RDF row {}", row)
         #raise Exception("Invalid RDF row")
 
 
 def tripels2dictionary(thin):
-    subject_ids = set(x["subject"] for x in thin)
-    subjects = {}
+    subjects = defaultdict(lambda: defaultdict(list))
 
-    # Convert rows to a subject dict.
-    for subject_id in subject_ids:
-        predicates = {}
-        for row in thin:
-            if row["subject"] != subject_id:
-                continue
-            predicate = row["predicate"]
-            if predicate not in predicates: 
-                predicates[predicate] = [] 
-            objects = predicates[predicate]  
-            objects.append(row2objectMap(row))
-            objects.sort(key=lambda k: str(k))
-            predicates[predicate] = objects 
-        subjects[subject_id] = predicates
+    # Convert rows to a subject dict in a single pass.
+    # Subject and predicate IRIs repeat across many rows,
+    # so intern them to share one string with a cached hash.
+    for row in thin:
+        subjects[intern(row["subject"])][intern(row["predicate"])].append(row2objectMap(row))
 
-    return subjects
+    # Sort each list of objects once, after all the rows have been collected.
+    for predicates in subjects.values():
+        for objects in predicates.values():
+            objects.sort(key=str)
+
+    return {subject: dict(predicates) for subject, predicates in subjects.items()}
 
 def blankNodeDependencies(thin):
-    subject_ids = set(x["subject"] for x in thin)
-    dependencies = {}
+    """Return the blank nodes each subject refers to,
+    and the reverse: the (subject, predicate) pairs that refer to each blank node."""
+    dependencies = defaultdict(set)
+    dependents = defaultdict(set)
 
-    # Convert rows to a subject dict.
-    for subject_id in subject_ids:
-        predicates = {}
-        for row in thin:
-            if row["subject"] != subject_id:
-                continue 
-            if row.get("object") and row["object"].startswith("_:"):
-                if not subject_id in dependencies:
-                    dependencies[subject_id] = set()
-                dependencies[subject_id].add(row["object"])
-    return dependencies
+    # Collect the blank nodes each subject refers to, in a single pass.
+    for row in thin:
+        o = row.get("object")
+        if o and o.startswith("_:"):
+            dependencies[row["subject"]].add(o)
+            dependents[o].add((row["subject"], row["predicate"]))
+    return dict(dependencies), dict(dependents)
 
 
 
 def getLeaves(subjects, dependencies): #blank nodes in subjects without dependencies
-    leaves = set()
-    for subject in subjects:
-        if(tUtil.isBlankNode(subject) and (not subject in dependencies)):
-            leaves.add(subject)
-    return leaves 
-
-def updateDependencies(objectValue, dependencies):
-    updates = [k for k,v in dependencies.items() if objectValue in v]
-    for u in updates:
-        dependencies[u].remove(objectValue)
+    return {s for s in subjects if s.startswith("_:") and s not in dependencies}
+
+def updateDependencies(objectValue, dependencies, dependents):
+    """Mark the blank node objectValue as resolved
+    and return the subjects that no longer have any dependencies."""
+    resolved = []
+    for u, _ in dependents.pop(objectValue, ()):
+        if u not in dependencies: #already resolved via another predicate
+            continue
+        dependencies[u].discard(objectValue)
         if not dependencies[u]:
             del dependencies[u]
-
-
-def resolveDependencies(subjects, dependencies):
-    while dependencies: #these are direct dependencies
-
-        leaves = getLeaves(subjects, dependencies) 
-        handled = set()
-        for subject, predicates in subjects.items():
-            for predicate in predicates.keys():
-                objects = []
-                #we iterate over predicates[predicate] (I)
-                #however, elements in predicates[predicates] are to be modified  (II)
-                #so, all (possibly modified) elements are collected in 'objects' (III)
-                #so that we can set predicates[predicates] = 'objects' later (IV)
-
-                for object in predicates[predicate]:  #(I)
-
-                    if(not tUtil.validObject(subject,predicate,object)):
-                        continue
-
-                    objectValue = object.get("object")
-                    if tUtil.isBlankNode(objectValue): #note blank nodes are used as subjects in triples 
-                        if objectValue in leaves: 
-                            object = {"object": subjects[objectValue]} #replace blank node with the structure it describes (II)
-                            handled.add(objectValue) #mark blank node as handled
-                            updateDependencies(objectValue, dependencies) 
-
-                    objects.append(object) #(III)
-                objects.sort(key=lambda k: str(k))
-                predicates[predicate] = objects #(IV)
-        for subject in handled: #delete all handled blank nodes
-            del subjects[subject]
-
-
+            resolved.append(u)
+    return resolved
+
+
+def resolveDependencies(subjects, dependencies, dependents):
+    validObject = tUtil.validObject
+    #drop invalid objects up front
+    for subject, predicates in subjects.items():
+        for predicate, objects in predicates.items():
+            if not all(objects):
+                predicates[predicate] = [o for o in objects if validObject(subject, predicate, o)]
+
+    #Kahn's algorithm: a blank node is ready once all of its own dependencies are resolved,
+    #so each reference to a blank node is visited exactly once
+    ready = deque(getLeaves(subjects, dependencies))
+    #bind the methods used on every step to locals
+    popReady = ready.popleft
+    pushReady = ready.append
+    popSubject = subjects.pop
+    while ready:
+        leaf = popReady()
+        if leaf not in dependents: #nothing refers to this blank node, so it stays a root
+            continue
+        nested = popSubject(leaf) #delete the handled blank node
+        for subject, predicate in dependents[leaf]:
+            objects = subjects[subject][predicate]
+            for i, object in enumerate(objects):
+                if object.get("object") == leaf:
+                    objects[i] = {"object": nested} #replace blank node with the structure it describes
+        for subject in updateDependencies(leaf, dependencies, dependents):
+            for objects in subjects[subject].values(): #all nested now, so sort into the final order
+                objects.sort(key=str)
+            if subject in dependents:
+                pushReady(subject)
+
+    if dependencies:
+        log("Unresolved blank nodes (cycles or missing subjects): {}", dependencies)
 
 
 def translate(thin):
@@ -139,21 +139,20 @@ def translate(thin):
     """ 
 
     subjects = tripels2dictionary(thin) 
-    dependencies = blankNodeDependencies(thin) 
-    leaves = getLeaves(subjects, dependencies) 
-    resolveDependencies(subjects, dependencies)
+    dependencies, dependents = blankNodeDependencies(thin) 
+    resolveDependencies(subjects, dependencies, dependents)
 
-    subjects = specialCase.handleAllDisjointClasses(subjects)
-    subjects = specialCase.handleAnnotations(subjects)
-    subjects = specialCase.handleReification(subjects) 
+    subjects = specialCase.applySpecialCases(subjects)
 
     return subjects
 
 
 if __name__ == "__main__":
-    log("THIN ROWS:")
-    [log(row) for row in thin]
-    print("DONE THIN ROWS")
+    if DEBUG:
+        log("THIN ROWS:")
+        for row in thin:
+            log(row)
+        log("DONE THIN ROWS")
 
     subjects = translate(thin)
     print("SUBJECTS:")
@@ -3,15 +3,23 @@ import sys
 DEBUG = True
 
 
-def log(message):
-    if DEBUG:
-        print(message, file=sys.stderr)
+if DEBUG:
+    def log(message, *args):
+        print(message.format(*args) if args else message, file=sys.stderr)
+else:
+    def log(message, *args):
+        pass
 
 
 def firstObject(predicates, predicate):
     """Given a prediate map, return the first 'object'."""
-    if predicates.get(predicate):
-        for obj in predicates[predicate]:
+    return firstObjectOf(predicates.get(predicate))
+
+
+def firstObjectOf(objects):
+    """Given a list of objects (or None), return the first 'object'."""
+    if objects:
+        for obj in objects:
             if obj.get("object"):
                 return obj["object"]
 
@@ -19,9 +27,5 @@ def firstObject(predicates, predicate):
 def validObject(s, p, o):
     if o:
         return True
-    log("Bad object: <{} {} {}>".format(s, p, o))
+    log("Bad object: <{} {} {}>", s, p, o)
     return False
-
-
-def isBlankNode(o):
-    return o and isinstance(o, str) and o.startswith("_:")
@@ -1,12 +1,16 @@
 import gizmos.export
 
 from sqlalchemy import create_engine
-from util import create_postgresql_db, create_sqlite_db, compare_graphs, postgres_url, sqlite_url
+from util import compare_graphs, postgres_url, sqlite_url
 
 
 def get_diff(actual_lines, expected_lines):
-    removed = list(set(expected_lines) - set(actual_lines))
-    added = list(set(actual_lines) - set(expected_lines))
+    if actual_lines == expected_lines:
+        return []
+    actual = set(actual_lines)
+    expected = set(expected_lines)
+    removed = list(expected - actual)
+    added = list(actual - expected)
     removed = [f"---\t{x}" for x in removed if x != ""]
     added = [f"+++\t{x}" for x in added if x != ""]
     return removed + added
@@ -16,10 +20,8 @@ def export(conn):
     tsv = gizmos.export.export(conn, ["OBI:0100046"], ["CURIE", "label", "definition"], "tsv")
     actual_lines = tsv.split("\n")
 
-    expected_lines = []
     with open("tests/resources/obi-export.tsv", "r") as f:
-        for line in f:
-            expected_lines.append(line.strip())
+        expected_lines = [line.strip() for line in f]
 
     diff = get_diff(actual_lines, expected_lines)
     if diff:
@@ -32,15 +34,10 @@ def export(conn):
 
 def export_no_predicates(conn):
     tsv = gizmos.export.export(conn, ["OBI:0100046"], [], "tsv", default_value_format="CURIE")
-    with open("test.tsv", "w") as f:
-        f.write(tsv)
-    actual_lines = tsv.split("\n")
-    actual_lines = [x.strip() for x in actual_lines]
+    actual_lines = [x.strip() for x in tsv.split("\n")]
 
-    expected_lines = []
     with open("tests/resources/obi-export-all.tsv", "r") as f:
-        for line in f:
-            expected_lines.append(line.strip())
+        expected_lines = [line.strip() for line in f]
 
     diff = get_diff(actual_lines, expected_lines)
     if diff:
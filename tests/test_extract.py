@@ -1,7 +1,7 @@
 from gizmos.extract import extract
 from rdflib import Graph
 from sqlalchemy import create_engine
-from util import create_postgresql_db, create_sqlite_db, compare_graphs, postgres_url, sqlite_url
+from util import compare_graphs, load_expected, postgres_url, sqlite_url
 
 
 def extract_no_hierarchy(conn):
@@ -15,8 +15,7 @@ def extract_no_hierarchy(conn):
     actual = Graph()
     actual.parse(data=ttl, format="turtle")
 
-    expected = Graph()
-    expected.parse("tests/resources/obi-extract-no-hierarchy.ttl", format="turtle")
+    expected = load_expected("tests/resources/obi-extract-no-hierarchy.ttl")
 
     compare_graphs(actual, expected)
 
@@ -27,8 +26,7 @@ def extract_with_ancestors(conn):
     actual = Graph()
     actual.parse(data=ttl, format="turtle")
 
-    expected = Graph()
-    expected.parse("tests/resources/obi-extract-ancestors.ttl", format="turtle")
+    expected = load_expected("tests/resources/obi-extract-ancestors.ttl")
 
     compare_graphs(actual, expected)
 
@@ -44,8 +42,7 @@ def extract_with_ancestors_no_intermediates(conn):
     actual = Graph()
     actual.parse(data=ttl, format="turtle")
 
-    expected = Graph()
-    expected.parse("tests/resources/obi-extract-ancestors-no-intermediates.ttl", format="turtle")
+    expected = load_expected("tests/resources/obi-extract-ancestors-no-intermediates.ttl")
 
     compare_graphs(actual, expected)
 
@@ -56,8 +53,7 @@ def extract_with_children(conn):
     actual = Graph()
     actual.parse(data=ttl, format="turtle")
 
-    expected = Graph()
-    expected.parse("tests/resources/obi-extract-children.ttl", format="turtle")
+    expected = load_expected("tests/resources/obi-extract-children.ttl")
 
     compare_graphs(actual, expected)
 
@@ -68,8 +64,7 @@ def extract_with_descendants(conn):
     actual = Graph()
     actual.parse(data=ttl, format="turtle")
 
-    expected = Graph()
-    expected.parse("tests/resources/obi-extract-descendants.ttl", format="turtle")
+    expected = load_expected("tests/resources/obi-extract-descendants.ttl")
 
     compare_graphs(actual, expected)
 
@@ -85,8 +80,7 @@ def extract_with_descendants_no_intermediates(conn):
     actual = Graph()
     actual.parse(data=ttl, format="turtle")
 
-    expected = Graph()
-    expected.parse("tests/resources/obi-extract-descendants-no-intermediates.ttl", format="turtle")
+    expected = load_expected("tests/resources/obi-extract-descendants-no-intermediates.ttl")
 
     compare_graphs(actual, expected)
 
@@ -97,8 +91,7 @@ def extract_with_parents(conn):
     actual = Graph()
     actual.parse(data=ttl, format="turtle")
 
-    expected = Graph()
-    expected.parse("tests/resources/obi-extract-parents.ttl", format="turtle")
+    expected = load_expected("tests/resources/obi-extract-parents.ttl")
 
     compare_graphs(actual, expected)
 
@@ -0,0 +1,66 @@
+import json
+import prototype
+
+
+def rdf_list(size):
+    """Build a nested rdf:List predicate map of ex:0 ... ex:<size - 1>."""
+    node = "rdf:nil"
+    for i in reversed(range(size)):
+        node = {
+            "rdf:type": [{"object": "rdf:List"}],
+            "rdf:first": [{"object": f"ex:{i}"}],
+            "rdf:rest": [{"object": node}],
+        }
+    return node
+
+
+def test_subjects2thick_long_list():
+    # Each list item adds four levels of nesting, past orjson's limit of 255
+    union = rdf_list(100)
+    thick = prototype.subjects2thick({"ex:s": {"owl:unionOf": [{"object": union}]}})
+    assert json.loads(thick[0]["object"]) == union
+    assert prototype.loads(thick[0]["object"]) == union
+
+
+def test_thick2triples_long_list():
+    union = rdf_list(100)
+    thick = [
+        {"subject": "ex:s", "predicate": "owl:unionOf", "object": json.dumps(union)},
+        {"subject": "ex:t", "predicate": "owl:unionOf", "object": json.dumps(union)},
+    ]
+    triples = prototype.thick2triples(thick)
+    graph = prototype.triples2graph(triples)
+    # Both subjects get their own copy of the list, with distinct blank nodes
+    assert len(graph) == 2 + 2 * 3 * 100
+    assert len(set(graph.objects(None, prototype.URIRef(prototype.deprefix("owl:unionOf"))))) == 2
+
+
+def restriction(**predicates):
+    result = {"rdf:type": [{"object": "owl:Restriction"}]}
+    for predicate, obj in predicates.items():
+        result[f"owl:{predicate}"] = [{"object": obj}]
+    return result
+
+
+def test_po2rdfa_some_values_from():
+    o = restriction(onProperty="ex:part-of", someValuesFrom="ex:bar")
+    html = prototype.po2rdfa({"ex:part-of": "part of"}, "rdfs:subClassOf", {"object": o})
+    assert html == [
+        "span",
+        ["a", {"href": "ex:part-of", "property": "owl:onProperty"}, "part of"],
+        " some ",
+        ["a", {"href": "ex:bar", "property": "owl:someValuesFrom"}, "ex:bar"],
+    ]
+
+
+def test_po2rdfa_all_values_from():
+    o = restriction(onProperty="ex:part-of", allValuesFrom="ex:bar")
+    html = prototype.po2rdfa({}, "rdfs:subClassOf", {"object": o})
+    assert html == ["span", str(o)]
+
+
+def test_po2rdfa_nested_restriction():
+    inner = restriction(onProperty="ex:has-part", someValuesFrom="ex:baz")
+    o = restriction(onProperty="ex:part-of", someValuesFrom=inner)
+    html = prototype.po2rdfa({}, "rdfs:subClassOf", {"object": o})
+    assert html == ["span", str(o)]
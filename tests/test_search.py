@@ -1,6 +1,6 @@
 from gizmos.search import search
 from sqlalchemy import create_engine
-from util import create_postgresql_db, create_sqlite_db, postgres_url, sqlite_url
+from util import postgres_url, sqlite_url
 
 
 def search_text(conn):
@@ -1,5 +1,6 @@
 import gizmos.tree
 import html5lib
+import pytest
 import sqlite3
 
 from pyRdfa.parse import parse_one_node
@@ -8,21 +9,24 @@ from pyRdfa.options import Options
 from rdflib import Graph
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Connection
-from util import compare_graphs, create_postgresql_db, create_sqlite_db, postgres_url, sqlite_url
+from util import compare_graphs, load_expected, postgres_url, sqlite_url
+
+# HTMLParser.parse resets the parser's state on each call, so build it once
+HTML_PARSER = html5lib.HTMLParser(tree=html5lib.treebuilders.getTreeBuilder("dom"))
 
 
 def check_term(conn: Connection, term: str, predicates: list):
     html = gizmos.tree.tree(conn, "obi", term, predicate_ids=predicates)
 
     # Create the DOM document element
-    parser = html5lib.HTMLParser(tree=html5lib.treebuilders.getTreeBuilder("dom"))
-    dom = parser.parse(html)
+    dom = HTML_PARSER.parse(html)
 
     # get the DOM tree
     top = dom.documentElement
 
     # Create the initial state (from pyRdfa)
     actual = Graph()
+    # Options collects warnings in its processor graph, so use a fresh one per term
     options = Options(
         output_default_graph=True,
         output_processor_graph=True,
@@ -43,33 +47,34 @@ def check_term(conn: Connection, term: str, predicates: list):
     # Add the RDFa to the RDFLib graph (recursive)
     parse_one_node(top, actual, None, state, [])
 
-    expected = Graph()
     if predicates:
-        expected.parse(f"tests/resources/obi-tree-{term}-predicates.ttl", format="turtle")
+        expected = load_expected(f"tests/resources/obi-tree-{term}-predicates.ttl")
     else:
-        expected.parse(f"tests/resources/obi-tree-{term}.ttl", format="turtle")
+        expected = load_expected(f"tests/resources/obi-tree-{term}.ttl")
 
     compare_graphs(actual, expected)
 
 
-def tree(conn):
-    check_term(conn, "OBI:0000666", [])
-    check_term(conn, "OBI:0000793", [])
-    check_term(
-        conn,
+TREE_CASES = [
+    ("OBI:0000666", []),
+    ("OBI:0000793", []),
+    (
         "OBI:0000793",
         ["rdfs:label", "IAO:0000115", "rdfs:subClassOf", "owl:equivalentClass", "rdf:type"],
-    )
-    check_term(conn, "OBI:0100046", [])
+    ),
+    ("OBI:0100046", []),
+]
 
 
-def test_tree_postgresql(create_postgresql_db):
+@pytest.mark.parametrize("term,predicates", TREE_CASES)
+def test_tree_postgresql(create_postgresql_db, term, predicates):
     engine = create_engine(postgres_url)
     with engine.connect() as conn:
-        tree(conn)
+        check_term(conn, term, predicates)
 
 
-def test_tree_sqlite(create_sqlite_db):
+@pytest.mark.parametrize("term,predicates", TREE_CASES)
+def test_tree_sqlite(create_sqlite_db, term, predicates):
     engine = create_engine(sqlite_url)
     with engine.connect() as conn:
-        tree(conn)
+        check_term(conn, term, predicates)
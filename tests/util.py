@@ -1,9 +1,11 @@
 import csv
 import os
-import pytest
 
+from functools import lru_cache
+from io import StringIO
+from rdflib import Graph
 from rdflib.compare import to_isomorphic, graph_diff
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 
 POSTGRES_USER = os.environ.get("POSTGRES_USER", "postgres")
 POSTGRES_PW = os.environ.get("POSTGRES_PW", "postgres")
@@ -13,14 +15,34 @@ postgres_url = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PW}@{POSTGRES_H
 
 sqlite_url = "sqlite:///" + os.path.abspath("build/obi.db")
 
+PREFIX_COLUMNS = ("prefix", "base")
+STATEMENT_COLUMNS = ("stanza", "subject", "predicate", "object", "value", "datatype", "language")
 
-def dump_ttl_sorted(graph):
-    for line in sorted(graph.serialize(format="ttl").splitlines()):
+
+def dump_nt_sorted(graph):
+    nt = graph.serialize(format="nt")
+    if isinstance(nt, bytes):
+        nt = nt.decode("utf-8")
+    for line in sorted(nt.splitlines()):
         if line:
             print(line)
 
 
+@lru_cache(maxsize=None)
+def load_expected(path):
+    """Parse an expected Turtle fixture once per session.
+    The graph is shared between callers, so it must not be modified."""
+    expected = Graph()
+    expected.parse(path, format="turtle")
+    return expected
+
+
 def compare_graphs(actual, expected):
+    # Graphs with the same triples are isomorphic, blank nodes or not,
+    # so only canonicalize and diff when a cheap comparison fails
+    if len(actual) == len(expected) and set(actual) == set(expected):
+        return
+
     actual_iso = to_isomorphic(actual)
     expected_iso = to_isomorphic(expected)
 
@@ -28,23 +50,59 @@ def compare_graphs(actual, expected):
         _, in_first, in_second = graph_diff(actual_iso, expected_iso)
         print("The actual and expected graphs differ")
         print("----- Contents of actual graph not in expected graph -----")
-        dump_ttl_sorted(in_first)
+        dump_nt_sorted(in_first)
         print("----- Contents of expected graph not in actual graph -----")
-        dump_ttl_sorted(in_second)
+        dump_nt_sorted(in_second)
 
     assert actual_iso == expected_iso
 
 
+@lru_cache(maxsize=None)
+def read_tsv(path, columns):
+    """Read a TSV fixture into rows of bind parameters, with empty cells as None.
+    The rows are parsed once and shared by the sqlite and PostgreSQL loaders,
+    so they must not be modified."""
+    with open(path) as f:
+        return [
+            dict(zip(columns, [None if not x else x for x in row]))
+            for row in csv.reader(f, delimiter="\t")
+        ]
+
+
+def insert_tsv(conn, table, columns, path):
+    """Bind the rows of a TSV fixture and insert them with a single executemany."""
+    params = ", ".join(":" + column for column in columns)
+    conn.execute(text(f"INSERT INTO {table} VALUES ({params})"), read_tsv(path, columns))
+
+
+def copy_tsv(conn, table, columns, path):
+    """Load a TSV fixture into a PostgreSQL table with COPY.
+    The rows come from read_tsv, as for the other backends, and are re-serialized as CSV,
+    so both backends load the same values. None is written as an empty unquoted cell,
+    which COPY loads as NULL."""
+    data = StringIO()
+    writer = csv.writer(data, delimiter="\t", lineterminator="\n")
+    writer.writerows([row[column] for column in columns] for row in read_tsv(path, columns))
+    data.seek(0)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table} FROM STDIN WITH (FORMAT csv, DELIMITER E'\\t', NULL '')", data
+        )
+    finally:
+        cursor.close()
+
+
 def add_tables(conn):
     with conn.begin():
         conn.execute("DROP TABLE IF EXISTS prefix")
         conn.execute(
             "CREATE TABLE prefix (" "  prefix TEXT PRIMARY KEY NOT NULL," "  base TEXT NOT NULL" ")"
         )
-        with open("tests/resources/prefix.tsv") as f:
-            rows = list(csv.reader(f, delimiter="\t"))
-            for r in rows:
-                conn.execute(f"INSERT INTO prefix VALUES ('{r[0]}', '{r[1]}')")
+        if conn.dialect.name == "postgresql":
+            copy_tsv(conn, "prefix", PREFIX_COLUMNS, "tests/resources/prefix.tsv")
+        else:
+            insert_tsv(conn, "prefix", PREFIX_COLUMNS, "tests/resources/prefix.tsv")
 
         conn.execute("DROP TABLE IF EXISTS statements")
         conn.execute(
@@ -58,23 +116,14 @@ def add_tables(conn):
             "  language TEXT"
             ")"
         )
-        with open("tests/resources/statements.tsv") as f:
-            rows = []
-            for row in csv.reader(f, delimiter="\t"):
-                rows.append([None if not x else x for x in row])
-            for r in rows:
-                query = []
-                for itm in r:
-                    if not itm:
-                        query.append("NULL")
-                        continue
-                    query.append("'" + itm.replace("'", "''").replace("%", "%%") + "'")
-                query = ", ".join(query)
-                conn.execute(f"INSERT INTO statements VALUES ({query})")
-
-
-@pytest.fixture
-def create_postgresql_db():
+        if conn.dialect.name == "postgresql":
+            copy_tsv(conn, "statements", STATEMENT_COLUMNS, "tests/resources/statements.tsv")
+        else:
+            insert_tsv(conn, "statements", STATEMENT_COLUMNS, "tests/resources/statements.tsv")
+
+
+def build_postgresql_db():
+    """Create the gizmos_test database if needed and load the fixture tables."""
     engine = create_engine(
         f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PW}@{POSTGRES_HOST}:{POSTGRES_PORT}",
         isolation_level="AUTOCOMMIT",
@@ -91,14 +140,17 @@ def create_postgresql_db():
         add_tables(conn)
 
 
-@pytest.fixture
-def create_sqlite_db():
+def build_sqlite_db():
+    """Load the fixture tables into build/obi.db."""
     if not os.path.isdir("build"):
         os.mkdir("build")
     engine = create_engine(sqlite_url)
     with engine.connect() as conn:
+        # build/obi.db is a throwaway fixture, so skip journaling and fsyncs while loading it
+        for pragma in ["journal_mode=MEMORY", "synchronous=OFF", "temp_store=MEMORY"]:
+            conn.execute(f"PRAGMA {pragma}")
         add_tables(conn)
 
 
 if __name__ == "__main__":
-    create_sqlite_db()
+    build_sqlite_db()